@@ -1,51 +1,138 @@
-import json,os,logging,random,threading,time,requests
-from flask import Flask,request,abort
-from linebot import LineBotApi,WebhookHandler
-from linebot.exceptions import InvalidSignatureError
+import os
+if __name__=="__main__":os.execvp("gunicorn",["gunicorn","app:app"])
+import re,hmac,base64,fcntl,tempfile,atexit,logging,random,threading,time,mmap,requests,orjson,redis
+from collections import deque
+from dataclasses import dataclass,field
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from flask import Flask,Response,request,abort
+from werkzeug.exceptions import HTTPException
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from linebot import LineBotApi
+from linebot.http_client import RequestsHttpClient,RequestsHttpResponse
 from linebot.models import *
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL","INFO").upper())
 app=Flask(__name__)
 TOKEN,SECRET=os.getenv("LINE_CHANNEL_ACCESS_TOKEN"),os.getenv("LINE_CHANNEL_SECRET")
 if not TOKEN or not SECRET:raise RuntimeError("Set LINE tokens")
-line,handler=LineBotApi(TOKEN),WebhookHandler(SECRET)
+
+class PooledHC(RequestsHttpClient):
+    sess=requests.Session();sess.mount("https://",HTTPAdapter(pool_maxsize=10,max_retries=Retry(total=2,read=0,backoff_factor=0.1)))
+    def post(s,url,headers=None,data=None,timeout=None):
+        return RequestsHttpResponse(s.sess.post(url,headers=headers,data=data,timeout=timeout or s.timeout))
+
+line,KEY=LineBotApi(TOKEN,http_client=PooledHC),SECRET.encode()
+URL,HDRS=line.endpoint+"/v2/bot/message/reply",{**line.headers,"Content-Type":"application/json"}
 
 C={'bg':'#0a0a0c','card':'#13131a','card_inner':'#1a1a22','primary':'#9C6BFF','primary_light':'#C7A3FF','accent':'#A67CFF','border':'#B58CFF','text':'#FFFFFF','text_dim':'#BFBFD9','text_muted':'#8C8CA3','btn_sec':'#1E1E27','btn_sec_txt':'#FFFFFF'}
 
+_tls=threading.local()
+def _rng():
+    r=getattr(_tls,"r",None)
+    if r is None:r=_tls.r=random.Random(os.urandom(8))
+    return r
+
+DRAW="local i=redis.call('SPOP',KEYS[1]) if i then return i end for j=0,tonumber(ARGV[1])-1 do redis.call('SADD',KEYS[1],j) end return redis.call('SPOP',KEYS[1])"
+
 class CM:
-    def __init__(s):s.files={};s.mention=[];s.riddles=[];s.games=[];s.quotes=[];s.situations=[];s.results={};s.used={}
+    def __init__(s,r=None):s.r=r;s.draw=r.register_script(DRAW)if r else None;s.files={};s.mention=[];s.riddles=[];s.games=();s.quotes=[];s.situations=[];s.results={};s.pool={};s.size={};s.locks={}
     def ld_l(s,f):
-        if not os.path.exists(f):return []
-        try:return[l.strip()for l in open(f,'r',encoding='utf-8')if l.strip()]
+        try:
+            with open(f,'rb')as fh:return[l for l in(x.decode('utf-8').strip()for x in fh.read().splitlines())if l]
+        except FileNotFoundError:logging.warning("missing: %s",f);return[]
         except:return[]
     def ld_j(s,f):
-        if not os.path.exists(f):return[]if'.json'in f else{}
-        try:return json.load(open(f,'r',encoding='utf-8'))
+        try:
+            with open(f,'rb')as fh,mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)as mm,memoryview(mm)as mv:return orjson.loads(mv)
+        except FileNotFoundError:logging.warning("missing: %s",f);return[]if'.json'in f else{}
         except:return[]if'.json'in f else{}
     def init(s):
-        s.files={"سؤال":s.ld_l("questions.txt"),"تحدي":s.ld_l("challenges.txt"),"اعتراف":s.ld_l("confessions.txt")}
-        s.mention=s.ld_l("more_questions.txt");s.situations=s.ld_l("situations.txt");s.riddles=s.ld_j("riddles.json")
-        s.quotes=s.ld_j("quotes.json");s.results=s.ld_j("detailed_results.json")
-        d=s.ld_j("personality_games.json");s.games=[d[k]for k in sorted(d.keys())]if isinstance(d,dict)else[]
-        s.used={k:[]for k in list(s.files.keys())+["منشن","لغز","اقتباس","موقف"]}
+        fs=["questions.txt","challenges.txt","confessions.txt","personality.txt","more_file.txt","situations.txt","riddles.json","quotes.json","detailed_results.json","personality_games.json"]
+        with ThreadPoolExecutor(max_workers=8)as ex:r=dict(zip(fs,ex.map(lambda f:s.ld_j(f)if f.endswith('.json')else s.ld_l(f),fs)))
+        s.files={"سؤال":r["questions.txt"],"تحدي":r["challenges.txt"],"اعتراف":r["confessions.txt"],"شخصي":r["personality.txt"]}
+        s.mention=r["more_file.txt"];s.situations=r["situations.txt"]
+        ok=lambda x,*k:all(isinstance(x.get(n)or'',str)for n in k)
+        s.riddles=[x for x in r["riddles.json"]if isinstance(x,dict)and x.get('question')and x.get('answer')and ok(x,'question','answer','hint')]
+        s.quotes=[x for x in r["quotes.json"]if isinstance(x,dict)and x.get('text')and ok(x,'text','author')];s.results=r["detailed_results.json"]
+        d=r["personality_games.json"];gs=[d[k]for k in sorted(d,key=lambda k:int(re.sub(r"\D","",k)or 0))]if isinstance(d,dict)else[]
+        s.games=tuple({**g,"questions":[q for q in g.get("questions")or()if isinstance(q,dict)and q.get('question')and isinstance(q.get('options'),dict)]}for g in gs if isinstance(g,dict))
+        src={**s.files,"منشن":s.mention,"لغز":s.riddles,"اقتباسات":s.quotes,"موقف":s.situations}
+        s.pool={k:deque(_rng().sample(range(len(v)),len(v)))for k,v in src.items()}
+        s.size={k:len(v)for k,v in src.items()};s.locks={k:threading.Lock()for k in src}
+    def reseed(s):_tls.r=None;s.pool={k:deque(_rng().sample(range(n),n))for k,n in s.size.items()}
     def rnd(s,k,mx):
         if mx==0:return 0
-        if len(s.used.get(k,[]))>=mx:s.used[k]=[]
-        av=[i for i in range(mx)if i not in s.used.get(k,[])]
-        idx=random.choice(av)if av else random.randint(0,mx-1)
-        if k not in s.used:s.used[k]=[]
-        s.used[k].append(idx);return idx
-    def get(s,c):l=s.files.get(c,[]);return l[s.rnd(c,len(l))]if l else None
-    def get_m(s):return s.mention[s.rnd("منشن",len(s.mention))]if s.mention else None
-    def get_s(s):return s.situations[s.rnd("موقف",len(s.situations))]if s.situations else None
-    def get_r(s):return s.riddles[s.rnd("لغز",len(s.riddles))]if s.riddles else None
-    def get_q(s):return s.quotes[s.rnd("اقتباس",len(s.quotes))]if s.quotes else None
-
-cm=CM();cm.init()
-rdl_st,gm_st={},{}
+        if s.draw:return int(s.draw(keys=[f"pool:{k}:{mx}"],args=[mx]))
+        lk=s.locks.get(k)or s.locks.setdefault(k,threading.Lock())
+        if s.size.get(k)!=mx:
+            with lk:
+                if s.size.get(k)!=mx:s.pool[k]=deque(_rng().sample(range(mx),mx));s.size[k]=mx
+        while True:
+            try:return s.pool[k].popleft()
+            except IndexError:
+                with lk:
+                    if not s.pool[k]:s.pool[k].extend(_rng().sample(range(mx),mx))
+
+RDS=redis.Redis.from_url(os.getenv("REDIS_URL"))if os.getenv("REDIS_URL")else None
+cm=CM(RDS);cm.init()
+
+@dataclass(slots=True)
+class Game:
+    gi:int
+    qi:int=0
+    cnt:dict=field(default_factory=lambda:dict.fromkeys("أبج",0))
+
+class RStore:
+    def __init__(s,r,p,t=lambda v:v,ttl=1800):s.r,s.p,s.t,s.ttl=r,p,t,ttl
+    def __contains__(s,k):return s.r.exists(s.p+k)>0
+    def __getitem__(s,k):
+        v=s.r.get(s.p+k)
+        if v is None:raise KeyError(k)
+        return s.t(orjson.loads(v))
+    def __setitem__(s,k,v):s.r.setex(s.p+k,s.ttl,orjson.dumps(v))
+    def __delitem__(s,k):s.r.delete(s.p+k)
+    def add(s,k):return bool(s.r.set(s.p+k,1,nx=True,ex=s.ttl))
+    def get(s,k,d=None):
+        v=s.r.get(s.p+k)
+        return d if v is None else s.t(orjson.loads(v))
+    def pop(s,k,*d):
+        v,_=s.r.pipeline().get(s.p+k).delete(s.p+k).execute()
+        if v is not None:return s.t(orjson.loads(v))
+        if d:return d[0]
+        raise KeyError(k)
+
+class Sessions(TTLCache):
+    def __init__(s,maxsize=100_000,ttl=1800):super().__init__(maxsize,ttl);s.lk=threading.RLock()
+    def __setitem__(s,k,v):
+        with s.lk:super().__setitem__(k,v)
+    def __delitem__(s,k):
+        with s.lk:super().__delitem__(k)
+    def add(s,k):
+        with s.lk:
+            if k in s:return False
+            s[k]=1;return True
+    def get(s,k,d=None):
+        with s.lk:return super().get(k,d)
+    def pop(s,k,*d):
+        with s.lk:return super().pop(k,*d)
+
+rdl_st,gm_st,msg_st=(RStore(RDS,"rdl:"),RStore(RDS,"gm:",lambda d:Game(**d)),RStore(RDS,"seen:",ttl=120))if RDS else(Sessions(),Sessions(),Sessions(10_000,120))
+
+def J(*ms):return b",".join(orjson.dumps(m.as_json_dict())for m in ms)
+
+S,SLOT=tuple(f"\x1f{i}"for i in range(3)),re.compile(rb"\\u001f(\d)")
+class Tpl:
+    def __init__(s,m):p=SLOT.split(J(m));s.parts,s.idx=p[::2],[int(i)for i in p[1::2]]
+    def __call__(s,*v):
+        e=[orjson.dumps(str(x))[1:-1]for x in v];o=[s.parts[0]]
+        for i,p in zip(s.idx,s.parts[1:]):o+=(e[i],p)
+        return b"".join(o)
 
 def menu():
-    items=[("سؤال","سؤال"),("منشن","منشن"),("اعتراف","اعتراف"),("تحدي","تحدي"),("موقف","موقف"),("اقتباسات","اقتباسات"),("لغز","لغز"),("تحليل","تحليل")]
+    items=[("سؤال","سؤال"),("شخصي","شخصي"),("منشن","منشن"),("اعتراف","اعتراف"),("تحدي","تحدي"),("موقف","موقف"),("اقتباسات","اقتباسات"),("لغز","لغز"),("تحليل","تحليل")]
     return QuickReply(items=[QuickReplyButton(action=MessageAction(label=l,text=t))for l,t in items])
 
 def hdr(t,i=""):
@@ -53,7 +140,7 @@ def hdr(t,i=""):
         contents=[TextComponent(text=f"{i} {t}"if i else t,weight='bold',size='xl',color=C['text'],align='center')])
 
 def help_flex():
-    cmds=["سؤال","منشن","اعتراف","تحدي","موقف","اقتباسات","لغز","تحليل"]
+    cmds=["سؤال","شخصي","منشن","اعتراف","تحدي","موقف","اقتباسات","لغز","تحليل"]
     items=[TextComponent(text=f"• {c}",size='md',color=C['text_dim'],margin='sm')for c in cmds]
     return FlexSendMessage(alt_text="مساعدة",contents=BubbleContainer(direction='rtl',
         styles=BubbleStyle(body=BlockStyle(backgroundColor=C['bg'])),
@@ -110,12 +197,7 @@ def gq_flex(t,q,p):
                 contents=[TextComponent(text=q['question'],size='md',color=C['text'],wrap=True)]),
             BoxComponent(layout='vertical',margin='lg',spacing='sm',contents=btns)])))
 
-def calc_res(ans,gi):
-    cnt={"أ":0,"ب":0,"ج":0}
-    for a in ans:
-        if a in cnt:cnt[a]+=1
-    mc=max(cnt,key=cnt.get)
-    return cm.results.get(f"لعبة{gi+1}",{}).get(mc,"شخصيتك فريدة ومميزة!")
+def calc_res(cnt,gi):return RES[gi][max("أبج",key=cnt.__getitem__)]
 
 def gr_flex(r):
     return FlexSendMessage(alt_text="النتيجة",contents=BubbleContainer(direction='rtl',
@@ -148,101 +230,120 @@ def quote_flex(q):
                     TextComponent(text=f'"{txt}"',size='lg',color=C['text'],wrap=True,align='center',style='italic'),
                     TextComponent(text=f"— {auth}",size='sm',color=C['text_muted'],align='center',margin='lg')])])))
 
-CMDS={"سؤال":["سؤال","سوال"],"تحدي":["تحدي"],"اعتراف":["اعتراف"],"منشن":["منشن"],"موقف":["موقف"],"لغز":["لغز"],"اقتباسات":["اقتباسات","اقتباس","حكمة"]}
-ICONS={"سؤال":"💭","تحدي":"🎯","اعتراف":"🤫","منشن":"👥","موقف":"🎭"}
+HELP_MSG=J(help_flex(),TextSendMessage(text="اختر من الأزرار:",quick_reply=menu()))
+GAMES_MSG=J(games_flex(cm.games))if cm.games else None
+TXT={k:J(TextSendMessage(text=v))for k,v in{"لغز":"لا توجد ألغاز متاحة","اقتباسات":"لا توجد اقتباسات","منشن":"لا توجد أسئلة","موقف":"لا توجد مواقف","تحليل":"لا توجد تحليلات متاحة","":"لا توجد بيانات","خطأ":"حدث خطأ، حاول مرة أخرى"}.items()}
+CONTENT_T,QUOTE_T,PUZZLE_T,RES_T=Tpl(content_flex(*S)),Tpl(quote_flex({'text':S[0],'author':S[1]})),Tpl(puzzle_flex({'question':S[0]})),Tpl(gr_flex(S[0]))
+ANS_T={t:Tpl(ans_flex(S[0],t))for t in("لمح","جاوب")}
+res=cm.results if isinstance(cm.results,dict)else{}
+RES=[{c:RES_T(res.get(f"لعبة{gi+1}",{}).get(c,"شخصيتك فريدة ومميزة!"))for c in"أبج"}for gi in range(len(cm.games))]
+GQ=[[J(gq_flex(g.get('title',f'تحليل {gi+1}')if qi==0 else g.get('title','تحليل'),q,f"{qi+1}/{len(g['questions'])}"))for qi,q in enumerate(g["questions"])]for gi,g in enumerate(cm.games)]
+ANSWERS={"لمح":[ANS_T["لمح"](r.get('hint')or'لا يوجد')for r in cm.riddles],"جاوب":[ANS_T["جاوب"](r['answer'])for r in cm.riddles]}
 
-def find_cmd(t):
-    t=t.lower().strip()
-    for k,v in CMDS.items():
-        if t in[x.lower()for x in v]:return k
-    return None
+CMDS={"سؤال":["سؤال","سوال","اسأله","اسئلة"],"شخصي":["شخصي","شخصيات"],"تحدي":["تحدي","تحديات","تحد"],"اعتراف":["اعتراف","اعترافات"],"منشن":["منشن","أكثر","اكثر"],"موقف":["موقف"],"لغز":["لغز"],"اقتباسات":["اقتباسات","اقتباس","حكمة"]}
+ICONS={"سؤال":"💭","شخصي":"💬","تحدي":"🎯","اعتراف":"🤫","منشن":"👥","موقف":"🎭"}
+BUBBLES={**{k:[CONTENT_T(k,ICONS.get(k,""),c)for c in v]for k,v in cm.files.items()},
+    "منشن":[CONTENT_T("منشن","👥",c)for c in cm.mention],"موقف":[CONTENT_T("موقف","🎭",c)for c in cm.situations],
+    "اقتباسات":[QUOTE_T(q['text'],q.get('author')or'مجهول')for q in cm.quotes],"لغز":[PUZZLE_T(r['question'])for r in cm.riddles]}
+ALIAS={a.lower():k for k,v in CMDS.items()for a in v}
+AMAP={"1":"أ","2":"ب","3":"ج","a":"أ","b":"ب","c":"ج","أ":"أ","ب":"ب","ج":"ج"}
+HELP_WORDS=frozenset(["مساعدة","help","بداية","start","قائمة","menu"])
+GAME_WORDS=frozenset(["تحليل","تحليل شخصية","شخصية","لعبه","لعبة"])
 
-def reply(tk,msg):
-    try:line.reply_message(tk,msg)
-    except Exception as e:logging.error(f"Err:{e}")
+EXEC,SLOTS=ThreadPoolExecutor(max_workers=10,thread_name_prefix="reply"),threading.BoundedSemaphore(100)
+
+def _send(tk,msg):
+    if not isinstance(msg,bytes):msg=J(*msg)if isinstance(msg,list)else J(msg)
+    try:
+        r=PooledHC.sess.post(URL,data=b'{"replyToken":%s,"messages":[%s]}'%(orjson.dumps(tk),msg),headers=HDRS,timeout=line.http_client.timeout)
+        if r.status_code!=200:logging.error("Err:%s %s",r.status_code,r.text)
+    except Exception as e:logging.error("Err:%s",e)
+    finally:SLOTS.release()
+
+def reply(tk,msg):SLOTS.acquire();EXEC.submit(_send,tk,msg)
+
+HOME_BODY,HEALTH_BODY=b"OK",orjson.dumps({"status":"ok"})
+STOP,LAST_HIT=threading.Event(),time.time()
+
+@app.before_request
+def seen():
+    global LAST_HIT
+    LAST_HIT=time.time()
 
 @app.route("/",methods=["GET"])
-def home():return"OK",200
+def home():return Response(HOME_BODY)
 
 @app.route("/health",methods=["GET"])
-def health():return{"status":"ok"},200
+def health():return Response(HEALTH_BODY,mimetype="application/json")
 
 @app.route("/callback",methods=["POST"])
 def callback():
-    sig=request.headers.get("X-Line-Signature","")
-    body=request.get_data(as_text=True)
-    try:handler.handle(body,sig)
-    except InvalidSignatureError:abort(400)
-    except:abort(500)
+    raw=request.get_data()
+    if not hmac.compare_digest(request.headers.get("X-Line-Signature","").encode(),base64.b64encode(hmac.digest(KEY,raw,"sha256"))):abort(400)
+    for e in orjson.loads(raw)["events"]:
+        if e["type"]=="message"and e["message"]["type"]=="text":
+            ev=MessageEvent.new_from_json_dict(e)
+            try:handle_msg(ev)
+            except Exception as x:logging.exception("Err:%s",x);reply(ev.reply_token,TXT["خطأ"])
     return"OK"
 
-@handler.add(MessageEvent,message=TextMessage)
+@app.errorhandler(Exception)
+def on_err(e):
+    if isinstance(e,HTTPException):return e
+    logging.exception("Err:%s",e);return"OK"
+
+def on_help(tk,uid):reply(tk,HELP_MSG)
+
+def on_content(cmd,tk,uid):
+    b=BUBBLES.get(cmd)
+    if not b:return reply(tk,TXT.get(cmd,TXT[""]))
+    i=cm.rnd(cmd,len(b))
+    if cmd=="لغز":rdl_st[uid]=i
+    reply(tk,b[i])
+
+def on_hint(tk,uid):
+    i=rdl_st.get(uid)
+    if i is not None:reply(tk,ANSWERS["لمح"][i])
+
+def on_answer(tk,uid):
+    i=rdl_st.pop(uid,None)
+    if i is not None:reply(tk,ANSWERS["جاوب"][i])
+
+def on_games(tk,uid):reply(tk,GAMES_MSG or TXT["تحليل"])
+
+DISPATCH={**dict.fromkeys(GAME_WORDS,on_games),"جاوب":on_answer,"لمح":on_hint,
+    **{a:partial(on_content,k)for a,k in ALIAS.items()},**dict.fromkeys(HELP_WORDS,on_help)}
+
 def handle_msg(ev):
-    uid,txt=ev.source.user_id,ev.message.text.strip()
+    if not msg_st.add(ev.message.id):return
+    src,txt=ev.source,ev.message.text.strip()
+    uid=src.user_id or getattr(src,"group_id",None)or getattr(src,"room_id",None)
     tl=txt.lower()
-    try:
-        if tl=="مساعدة":
-            reply(ev.reply_token,[help_flex(),TextSendMessage(text="اختر من الأزرار:",quick_reply=menu())])
-            return
-        cmd=find_cmd(txt)
-        if cmd:
-            if cmd=="لغز":
-                r=cm.get_r()
-                if r:rdl_st[uid]=r;reply(ev.reply_token,puzzle_flex(r))
-                else:reply(ev.reply_token,TextSendMessage(text="لا توجد ألغاز متاحة"))
-            elif cmd=="اقتباسات":
-                q=cm.get_q()
-                if q:reply(ev.reply_token,quote_flex(q))
-                else:reply(ev.reply_token,TextSendMessage(text="لا توجد اقتباسات"))
-            elif cmd=="منشن":
-                q=cm.get_m()
-                if q:reply(ev.reply_token,content_flex("منشن","👥",q))
-                else:reply(ev.reply_token,TextSendMessage(text="لا توجد أسئلة"))
-            elif cmd=="موقف":
-                s=cm.get_s()
-                if s:reply(ev.reply_token,content_flex("موقف","🎭",s))
-                else:reply(ev.reply_token,TextSendMessage(text="لا توجد مواقف"))
-            else:
-                c=cm.get(cmd)
-                ic=ICONS.get(cmd,"")
-                if c:reply(ev.reply_token,content_flex(cmd,ic,c))
-                else:reply(ev.reply_token,TextSendMessage(text="لا توجد بيانات"))
-            return
-        if tl=="لمح":
-            if uid in rdl_st:reply(ev.reply_token,ans_flex(rdl_st[uid].get('hint','لا يوجد'),"لمح"))
-            return
-        if tl=="جاوب":
-            if uid in rdl_st:r=rdl_st.pop(uid);reply(ev.reply_token,ans_flex(r['answer'],"جاوب"))
-            return
-        if tl in["تحليل","تحليل شخصية","شخصية"]:
-            if cm.games:reply(ev.reply_token,games_flex(cm.games))
-            else:reply(ev.reply_token,TextSendMessage(text="لا توجد تحليلات متاحة"))
-            return
-        if txt.isdigit()and uid not in gm_st and 1<=int(txt)<=len(cm.games):
-            gi=int(txt)-1;gm_st[uid]={"gi":gi,"qi":0,"ans":[]}
-            g=cm.games[gi];reply(ev.reply_token,gq_flex(g.get('title',f'تحليل {int(txt)}'),g["questions"][0],f"1/{len(g['questions'])}"))
-            return
-        if uid in gm_st:
-            st=gm_st[uid]
-            amap={"1":"أ","2":"ب","3":"ج","a":"أ","b":"ب","c":"ج","أ":"أ","ب":"ب","ج":"ج"}
-            ans=amap.get(tl,None)
-            if ans:
-                st["ans"].append(ans);g=cm.games[st["gi"]];st["qi"]+=1
-                if st["qi"]<len(g["questions"]):reply(ev.reply_token,gq_flex(g.get('title','تحليل'),g["questions"][st["qi"]],f"{st['qi']+1}/{len(g['questions'])}"))
-                else:reply(ev.reply_token,gr_flex(calc_res(st["ans"],st["gi"])));del gm_st[uid]
-                return
-    except Exception as e:logging.error(f"Err:{e}");reply(ev.reply_token,TextSendMessage(text="حدث خطأ، حاول مرة أخرى"))
+    h=DISPATCH.get(tl)
+    if h:return h(ev.reply_token,uid)
+    st=gm_st.get(uid)
+    if st is None:
+        if txt.isdigit()and 1<=int(txt)<=len(GQ)and GQ[int(txt)-1]:gi=int(txt)-1;gm_st[uid]=Game(gi);reply(ev.reply_token,GQ[gi][0])
+        return
+    ans=AMAP.get(tl)
+    if ans:
+        st.cnt[ans]+=1;q=GQ[st.gi];st.qi+=1
+        if st.qi<len(q):gm_st[uid]=st;reply(ev.reply_token,q[st.qi])
+        else:gm_st.pop(uid,None);reply(ev.reply_token,calc_res(st.cnt,st.gi))
 
 def keep_alive():
+    global LAST_HIT
     url=os.getenv("RENDER_EXTERNAL_URL")or os.getenv("REPL_SLUG")
     if url and not url.startswith("http"):url=f"https://{url}.onrender.com"
-    while True:
-        try:
-            if url:requests.get(f"{url}/health",timeout=5)
-            time.sleep(840)
+    while not STOP.wait(max(LAST_HIT+840-time.time(),60)):
+        if time.time()-LAST_HIT<840:continue
+        try:requests.get(f"{url}/health",timeout=5)
         except:pass
+        LAST_HIT=time.time()
 
-if __name__=="__main__":
-    if os.getenv("RENDER_EXTERNAL_URL")or os.getenv("REPL_SLUG"):
-        threading.Thread(target=keep_alive,daemon=True).start()
-    app.run(host="0.0.0.0",port=int(os.getenv("PORT",5000)))
+def start_keep_alive():
+    global KA
+    if not(os.getenv("RENDER_EXTERNAL_URL")or os.getenv("REPL_SLUG")):return
+    try:KA=open(os.path.join(tempfile.gettempdir(),"botabeer-keepalive.lock"),"w");fcntl.flock(KA,fcntl.LOCK_EX|fcntl.LOCK_NB)
+    except OSError:return
+    threading.Thread(target=keep_alive,daemon=True).start();atexit.register(STOP.set)
@@ -0,0 +1,11 @@
+import os,sys
+from gevent import monkey;monkey.patch_all()
+
+bind=f"0.0.0.0:{os.getenv('PORT',5000)}"
+worker_class,worker_connections,keepalive="gevent",1000,75
+workers=int(os.getenv("WEB_CONCURRENCY",os.cpu_count()or 2))if os.getenv("REDIS_URL")else 1
+if not os.getenv("REDIS_URL")and int(os.getenv("WEB_CONCURRENCY",1))>1:print("WEB_CONCURRENCY ignored: without REDIS_URL sessions are per-process, running 1 worker",file=sys.stderr)
+worker_tmp_dir,preload_app="/dev/shm",True
+
+def post_fork(server,worker):
+    import app;app.cm.reseed();app.start_keep_alive()